@@ -6,60 +6,63 @@
 
 from machine import SPI, Pin
 import os
+import sys
 from winbond import W25QFlash, version
 
 os_info = os.uname()
 print('MicroPython infos: {}'.format(os_info))
 print('Used micropthon-winbond version: {}'.format(version.__version__))
 
-try:
-    if 'pyboard' in os_info:
-        # NOT YET TESTED !
-        # https://docs.micropython.org/en/latest/library/pyb.SPI.html#pyb.SPI
-        CS_PIN = Pin(1)
-        spi = SPI(1)
-    elif 'esp8266' in os_info:
-        # NOT YET TESTED !
-        # https://docs.micropython.org/en/latest/esp8266/quickref.html#hardware-spi-bus
-        # SPI(0) is used for FlashROM and not available to users
-        # highest possible baudrate is 40 MHz for ESP-12
-        CS_PIN = Pin(1)
-        spi = SPI(1)
-    elif 'esp32' in os_info:
-        # https://docs.micropython.org/en/latest/esp32/quickref.html#hardware-spi-bus
-        # Pin   HSPI (id=1)   VSPI (id=2)
-        # -------------------------------
-        # sck   14            18
-        # mosi  13            23
-        # miso  12            19
-        # cs    x, here 5     x, here 5
-        if 'esp32s3' in os_info.machine.lower():
-            CS_PIN = Pin(10)
-            spi = SPI(2, 2000000, sck=Pin(12), mosi=Pin(11), miso=Pin(13))
-        else:
-            CS_PIN = Pin(5)
-            spi = SPI(2)
-    elif 'rp2' in os_info:
-        # https://docs.micropython.org/en/latest/rp2/quickref.html#hardware-spi-bus
-        # Pin   id=0   id=1
-        # -------------------------------
-        # sck   6            10
-        # mosi  7            11
-        # miso  4            8
-        # cs    x, here 5    x, here 5
-        CS_PIN = Pin(5)
-        spi = SPI(0)
-    else:
-        raise Exception(
-            'Unknown device, no default values for CS_PIN and spi defined: {}'.
-            format(os_info)
-        )
-except AttributeError:
-    pass
-except Exception as e:
-    raise e
+# platform: (SPI id, CS pin)
+SPI_CONFIG = {
+    # NOT YET TESTED !
+    # https://docs.micropython.org/en/latest/library/pyb.SPI.html#pyb.SPI
+    'pyboard': (1, 1),
+    # NOT YET TESTED !
+    # https://docs.micropython.org/en/latest/esp8266/quickref.html#hardware-spi-bus
+    # SPI(0) is used for FlashROM and not available to users
+    # highest possible baudrate is 40 MHz for ESP-12
+    'esp8266': (1, 1),
+    # https://docs.micropython.org/en/latest/esp32/quickref.html#hardware-spi-bus
+    # Pin   HSPI (id=1)   VSPI (id=2)
+    # -------------------------------
+    # sck   14            18
+    # mosi  13            23
+    # miso  12            19
+    # cs    x, here 5     x, here 5
+    'esp32': (2, 5),
+    # https://docs.micropython.org/en/latest/rp2/quickref.html#hardware-spi-bus
+    # Pin   id=0   id=1
+    # -------------------------------
+    # sck   6            10
+    # mosi  7            11
+    # miso  4            8
+    # cs    x, here 5    x, here 5
+    'rp2': (0, 5),
+}
+
+spi_config = SPI_CONFIG.get(sys.platform)
+if spi_config is None:
+    raise Exception(
+        'Unknown device, no default values for CS_PIN and spi defined: {}'.
+        format(os_info)
+    )
+
+if sys.platform == 'esp32' and 'ESP32S3' in os_info.machine.upper():
+    # BE-ESP32-01, keep the custom pin configuration of the SPI
+    CS_PIN = Pin(10)
+    spi = SPI(2, 2000000, sck=Pin(12), mosi=Pin(11), miso=Pin(13))
+    reinit_spi = False
+else:
+    CS_PIN = Pin(spi_config[1])
+    spi = SPI(spi_config[0])
+    reinit_spi = True
 
-flash = W25QFlash(spi=spi, cs=CS_PIN, baud=2000000, software_reset=True)
+flash = W25QFlash(spi=spi,
+                  cs=CS_PIN,
+                  baud=2000000,
+                  software_reset=True,
+                  reinit_spi=reinit_spi)
 
 # get Flash infos/properties
 print("Flash manufacturer ID: 0x{0:02x}".format(flash.manufacturer))
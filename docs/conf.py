@@ -27,6 +27,11 @@ try:
         sys.modules[module] = Mock()
         print("Mocked '{}' module".format(module))
 
+    # keep decorated functions documentable and constants usable
+    sys.modules['micropython'].native = lambda func: func
+    sys.modules['micropython'].viper = lambda func: func
+    sys.modules['micropython'].const = lambda value: value
+
     import winbond
 except ImportError:
     raise SystemExit("winbond has to be importable")
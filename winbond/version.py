@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 
-__version_info__ = ("0", "5", "4")
+__version_info__ = ("0", "10", "5")
 __version__ = ".".join(__version_info__)
@@ -7,22 +7,41 @@ Credits & kudos to crizeo
 Taken from https://forum.micropython.org/viewtopic.php?f=16&t=3899
 """
 
+import micropython
 from micropython import const
 import time
 from machine import SPI, Pin
 
+_SECTOR_SIZE = const(4096)
+_BLOCK_SIZE = const(512)
+_PAGE_SIZE = const(256)
+
+# content of an erased page, programming it does not change the flash
+_BLANK_PAGE = b'\xFF' * _PAGE_SIZE
+# content of an erased block, used to pad incomplete blocks
+_BLANK_BLOCK = b'\xFF' * _BLOCK_SIZE
+
 
 class W25QFlash(object):
     """W25QFlash implementation"""
-    SECTOR_SIZE = const(4096)
-    BLOCK_SIZE = const(512)
-    PAGE_SIZE = const(256)
+    SECTOR_SIZE = _SECTOR_SIZE
+    BLOCK_SIZE = _BLOCK_SIZE
+    PAGE_SIZE = _PAGE_SIZE
+
+    # default SCK clock rate per detected memory type, see identify
+    BAUD_RATES = {
+        0x40: 40000000,     # W25QxxBV/FV/JV-IQ
+        0x60: 50000000,     # W25QxxFW/JW (1.8V)
+        0x70: 80000000,     # W25QxxJV-IM
+    }
 
     def __init__(self,
                  spi: SPI,
                  cs: Pin,
-                 baud: int = 40000000,
-                 software_reset: bool = True) -> None:
+                 baud: int = None,
+                 software_reset: bool = True,
+                 cache_sectors: int = 2,
+                 reinit_spi: bool = True) -> None:
         """
         Constructs a new instance.
 
@@ -30,10 +49,18 @@ class W25QFlash(object):
         :type       spi:             SPI
         :param      cs:              The CS pin object
         :type       cs:              Pin
-        :param      baud:            The SCK clock rate
+        :param      baud:            The SCK clock rate, selected based on
+                                     the detected memory type if None
         :type       baud:            int
         :param      software_reset:  Flag to use software reset
         :type       software_reset:  bool
+        :param      cache_sectors:   Number of sectors kept in the RAM
+                                     write-back cache, 4kB each
+        :type       cache_sectors:   int
+        :param      reinit_spi:      Flag to initialise the SPI with baud,
+                                     keep the configuration of the given SPI
+                                     object and ignore baud if False
+        :type       reinit_spi:      bool
         """
         self._manufacturer = 0x0
         self._mem_type = 0
@@ -43,23 +70,61 @@ class W25QFlash(object):
         self.cs = cs
         self.spi = spi
         self.cs.init(self.cs.OUT, value=1)
-        # highest possible baudrate is 40 MHz for ESP-12
-        self.spi.init(baudrate=baud, phase=1, polarity=1)
-        self._busy = False
+        if reinit_spi:
+            # identify the chip with a safe clock rate if none is given
+            self.spi.init(baudrate=baud or 2000000, phase=1, polarity=1)
+        # an erase or program operation of a previous session may still be in
+        # progress, set after every erase or program, cleared by _await
+        self._op_pending = True
+        # buffer for reading a status register without allocating memory
+        self._stat_buf = bytearray(1)
 
         if software_reset:
             self.reset()
 
-        # buffer for writing single blocks
-        self._cache = bytearray(self.SECTOR_SIZE)
+        # write-back cache of sectors, a sector is written to the flash if
+        # it is evicted as least recently used one or on sync
+        # sector number -> [sector buffer, dirty block bitmask, erase flag]
+        self._sector_cache = {}
+        # cached sector numbers, least recently used first
+        self._lru = []
+        # unused sector buffers, allocated once to avoid fragmentation
+        self._free = [bytearray(_SECTOR_SIZE)
+                      for _ in range(max(1, cache_sectors))]
 
         # calc number of bytes (and makes sure the chip is detected and
         # supported)
         self.identify()
 
+        if reinit_spi and baud is None:
+            # the SPI peripheral limits the rate to its own maximum, which is
+            # 40 MHz for ESP-12
+            baud = self.BAUD_RATES.get(self._mem_type, 40000000)
+            self.spi.init(baudrate=baud, phase=1, polarity=1)
+
         # address length (default: 3 bytes, 32MB+: 4)
         self._ADR_LEN = 3 if (len(bin(self._capacity - 1)) - 2) <= 24 else 4
 
+        # buffer for the address bytes of a command and the function to
+        # pack an address into it, selected once for the address length
+        self._addr_buf = bytearray(self._ADR_LEN)
+        if self._ADR_LEN == 4:
+            self._pack_addr = self._pack_addr_4
+        else:
+            self._pack_addr = self._pack_addr_3
+
+        # buffer for a complete 'Page Program' frame (command, address, data)
+        self._cmd_buf = bytearray(1 + self._ADR_LEN + _PAGE_SIZE)
+        self._cmd_buf[0] = 0x02  # 'Page Program' command
+
+        # buffer for the 'Fast Read' header (command, address, dummy byte)
+        self._read_hdr = bytearray(2 + self._ADR_LEN)
+        # 'Fast Read' (0x03 = default), 0x0C for 4-byte mode command
+        # 'Fast Read Dual/Quad Output' (0x3B/0x6B) can not be used, as
+        # machine.SPI only supports a single data line (MISO) on all ports
+        self._read_hdr[0] = 0x0C if self._ADR_LEN == 4 else 0x0B
+        self._read_hdr[-1] = 0xFF  # dummy byte
+
         # setup address mode:
         if self._ADR_LEN == 4:
             if not self._read_status_reg(nr=16):  # not in 4-byte mode
@@ -136,9 +201,7 @@ class W25QFlash(object):
         the SUS bit in Status Register before issuing the Reset command
         sequence.
         """
-        if self._busy:
-            self._await()
-        self._busy = True
+        self._await()
         self.cs(0)
         self.spi.write(b'\x66')  # 'Enable Reset' command
         self.cs(1)
@@ -146,7 +209,6 @@ class W25QFlash(object):
         self.spi.write(b'\x99')  # 'Reset' command
         self.cs(1)
         time.sleep_us(30)
-        self._busy = False
 
     def identify(self) -> None:
         """
@@ -196,12 +258,55 @@ class W25QFlash(object):
         file system. As always, you will then need to run
         "os.mount(flash, '/MyFlashDir')" then to mount the flash
         """
+        # discard any cached changes, everything will be erased anyway
+        self._drop_sectors(first=0, last=self._capacity // _SECTOR_SIZE)
+
         self._wren()
         self._await()
         self.cs(0)
         self.spi.write(b'\xC7')  # 'Chip Erase' command
         self.cs(1)
-        self._await()  # wait for the chip to finish formatting
+        self._op_pending = True
+        # wait for the chip to finish formatting, this takes up to 12.5 sec
+        # per MB (e.g. 400 sec for 32MB), wait twice as long (25ms per kB)
+        self._await(timeout=(self._capacity >> 10) * 25)
+
+    def erase_range(self, addr: int, length: int) -> None:
+        """
+        Reset all memory within the specified range to 0xFF.
+
+        The range is erased with the largest possible erase commands, 64kB
+        and 32kB block erase for aligned parts and 4kB sector erase for the
+        rest of the range.
+
+        :param      addr:    The start address, multiple of self.SECTOR_SIZE
+        :type       addr:    int
+        :param      length:  The length in bytes, multiple of self.SECTOR_SIZE
+        :type       length:  int
+        """
+        assert not addr % _SECTOR_SIZE, \
+            "address ({}) not at sector start".format(addr)
+        assert not length % _SECTOR_SIZE, \
+            "invalid length: {}".format(length)
+        assert addr + length <= self._capacity, \
+            ("memory not addressable at {} with range {} (max.: {})".
+                format(hex(addr), length, hex(self._capacity - 1)))
+
+        end = addr + length
+        # discard any cached changes, the sectors will be erased anyway
+        self._drop_sectors(first=addr // _SECTOR_SIZE,
+                           last=end // _SECTOR_SIZE)
+
+        while addr < end:
+            if not addr & 0xFFFF and end - addr >= 0x10000:
+                self._block_erase_64k(addr=addr)
+                addr += 0x10000
+            elif not addr & 0x7FFF and end - addr >= 0x8000:
+                self._block_erase_32k(addr=addr)
+                addr += 0x8000
+            else:
+                self._sector_erase(addr=addr)
+                addr += _SECTOR_SIZE
 
     def _read_status_reg(self, nr) -> int:
         """
@@ -217,28 +322,90 @@ class W25QFlash(object):
         self.cs(0)
         # 'Read Status Register-...' (1, 2, 3) command
         self.spi.write((b'\x05', b'\x35', b'\x15')[reg])
-        stat = 2**bit & self.spi.read(1, 0xFF)[0]
+        self.spi.readinto(self._stat_buf, 0xFF)
+        stat = 2**bit & self._stat_buf[0]
         self.cs(1)
 
         return stat
 
-    def _await(self) -> None:
+    def _await(self, timeout: int = 2000, max_delay: int = 2000) -> None:
         """
         Wait for device not to be busy
+
+        Returns immediately if no erase or program operation has been started
+        since the last call. Otherwise the BUSY bit is polled every 10us for
+        the first millisecond, which covers fast operations like a page
+        program (approx. 0.7ms). Longer operations like an erase are polled
+        with an exponentially growing delay, capped at max_delay.
+
+        :param      timeout:    The maximum time to wait in milliseconds
+        :type       timeout:    int
+        :param      max_delay:  The maximum delay between polls in microseconds
+        :type       max_delay:  int
         """
-        self._busy = True
+        if not self._op_pending:
+            return
+
         self.cs(0)
         self.spi.write(b'\x05')  # 'Read Status Register-1' command
 
         # last bit (1) is BUSY bit in stat. reg. byte (0 = not busy, 1 = busy)
-        trials = 0
-        while 0x1 & self.spi.read(1, 0xFF)[0]:
-            if trials > 5E6:
+        delay = 10
+        waited = 0
+        deadline = time.ticks_add(time.ticks_ms(), timeout)
+        stat_buf = self._stat_buf
+        self.spi.readinto(stat_buf, 0xFF)
+        while 0x1 & stat_buf[0]:
+            if time.ticks_diff(time.ticks_ms(), deadline) > 0:
+                self.cs(1)
                 raise Exception("Device keeps busy, aborting.")
-            time.sleep_us(1)
-            trials += 1
+            time.sleep_us(delay)
+            waited += delay
+            if waited >= 1000:
+                # no fast operation, back off to not keep the bus busy
+                delay = min(delay * 2, max_delay)
+            self.spi.readinto(stat_buf, 0xFF)
         self.cs(1)
-        self._busy = False
+        self._op_pending = False
+
+    @micropython.viper
+    def _pack_addr_3(self, addr: int):
+        """
+        Pack a 3 byte address into the address buffer without allocating.
+
+        Used as _pack_addr in 3-byte address mode.
+
+        :param      addr:  The address
+        :type       addr:  int
+
+        :returns:   The address buffer with the big endian address bytes
+        :rtype:     bytearray
+        """
+        b = ptr8(self._addr_buf)  # noqa: F821
+        b[0] = (addr >> 16) & 0xFF
+        b[1] = (addr >> 8) & 0xFF
+        b[2] = addr & 0xFF
+        return self._addr_buf
+
+    @micropython.viper
+    def _pack_addr_4(self, addr: int):
+        """
+        Pack a 4 byte address into the address buffer without allocating.
+
+        Used as _pack_addr in 4-byte address mode.
+
+        :param      addr:  The address
+        :type       addr:  int
+
+        :returns:   The address buffer with the big endian address bytes
+        :rtype:     bytearray
+        """
+        b = ptr8(self._addr_buf)  # noqa: F821
+        b[0] = (addr >> 24) & 0xFF
+        b[1] = (addr >> 16) & 0xFF
+        b[2] = (addr >> 8) & 0xFF
+        b[3] = addr & 0xFF
+        return self._addr_buf
 
     def _sector_erase(self, addr) -> None:
         """
@@ -251,9 +418,45 @@ class W25QFlash(object):
         self._await()
         self.cs(0)
         self.spi.write(b'\x20')  # 'Sector Erase' command
-        self.spi.write(addr.to_bytes(self._ADR_LEN, 'big'))
+        self.spi.write(self._pack_addr(addr))
+        self.cs(1)
+        self._op_pending = True
+
+    def _block_erase_32k(self, addr) -> None:
+        """
+        Resets all memory within the specified block (32kB) to 0xFF
+
+        :param      addr:  The address
+        :type       addr:  int
+        """
+        self._wren()
+        self._await()
+        self.cs(0)
+        self.spi.write(b'\x52')  # 'Block Erase (32KB)' command
+        self.spi.write(self._pack_addr(addr))
         self.cs(1)
+        self._op_pending = True
+        # wait with a margin, erasing a block takes up to 1.6 sec
+        self._await(timeout=3000)
+
+    def _block_erase_64k(self, addr) -> None:
+        """
+        Resets all memory within the specified block (64kB) to 0xFF
 
+        :param      addr:  The address
+        :type       addr:  int
+        """
+        self._wren()
+        self._await()
+        self.cs(0)
+        self.spi.write(b'\xD8')  # 'Block Erase (64KB)' command
+        self.spi.write(self._pack_addr(addr))
+        self.cs(1)
+        self._op_pending = True
+        # wait with a margin, erasing a block takes up to 2 sec
+        self._await(timeout=3000)
+
+    @micropython.native
     def _read(self, buf: list, addr: int) -> None:
         """
         Read the length of the buffer bytes from the chip.
@@ -269,12 +472,12 @@ class W25QFlash(object):
             "memory not addressable at %s with range %d (max.: %s)" % \
             (hex(addr), len(buf), hex(self._capacity - 1))
 
+        read_hdr = self._read_hdr
+        read_hdr[1:1 + self._ADR_LEN] = self._pack_addr(addr)
+
         self._await()
         self.cs(0)
-        # 'Fast Read' (0x03 = default), 0x0C for 4-byte mode command
-        self.spi.write(b'\x0C' if self._ADR_LEN == 4 else b'\x0B')
-        self.spi.write(addr.to_bytes(self._ADR_LEN, 'big'))
-        self.spi.write(b'\xFF')  # dummy byte
+        self.spi.write(read_hdr)  # command, address and dummy byte
         self.spi.readinto(buf, 0xFF)
         self.cs(1)
 
@@ -287,6 +490,7 @@ class W25QFlash(object):
         self.spi.write(b'\x06')  # 'Write Enable' command
         self.cs(1)
 
+    @micropython.native
     def _write(self, buf: list, addr: int) -> None:
         """
         Write the data of the given buffer to the address location
@@ -297,14 +501,15 @@ class W25QFlash(object):
         of page), because wrapping to the next page (if page size exceeded)
         is implemented for full pages only. Length of <buf> has to be a
         multiple of self.PAGE_SIZE, because only full pages are supported at
-        the moment (<addr> will be auto-incremented).
+        the moment (<addr> will be auto-incremented). Pages containing only
+        0xFF are skipped, as programming them does not change the flash.
 
         :param      buf:   The data buffer to write
         :type       buf:   list
         :param      addr:  The starting address
         :type       addr:  int
         """
-        assert len(buf) % self.PAGE_SIZE == 0, \
+        assert len(buf) % _PAGE_SIZE == 0, \
             "invalid buffer length: {}".format(len(buf))
         assert not addr & 0xf, \
             "address ({}) not at page start".format(addr)
@@ -312,71 +517,258 @@ class W25QFlash(object):
             ("memory not addressable at {} with range {} (max.: {})".
                 format(hex(addr), len(buf), hex(self._capacity - 1)))
 
-        for i in range(0, len(buf), self.PAGE_SIZE):
-            self._wren()
-            self._await()
+        cmd_buf = self._cmd_buf
+        data_start = 1 + self._ADR_LEN
+        buf_mv = memoryview(buf)
+
+        # wait for a previous operation, e.g. a sector erase, to finish
+        self._await()
+
+        for i in range(0, len(buf), _PAGE_SIZE):
+            page = buf_mv[i:i + _PAGE_SIZE]
+            if page == _BLANK_PAGE:
+                # nothing to program, all bits stay 1
+                addr += _PAGE_SIZE
+                continue
+
+            # prepare the frame while the previous page is programmed
+            cmd_buf[1:data_start] = self._pack_addr(addr)
+            cmd_buf[data_start:] = page
+            # poll tightly, a page program takes approx. 0.7ms
+            self._await(max_delay=100)
             self.cs(0)
-            self.spi.write(b'\x02')  # 'Page Program' command
-            self.spi.write(addr.to_bytes(self._ADR_LEN, 'big'))
-            self.spi.write(buf[i:i + self.PAGE_SIZE])
-            addr += self.PAGE_SIZE
+            self.spi.write(b'\x06')  # 'Write Enable' command
             self.cs(1)
+            self.cs(0)
+            self.spi.write(cmd_buf)  # command, address and page data at once
+            addr += _PAGE_SIZE
+            self.cs(1)
+            self._op_pending = True
+
+    @staticmethod
+    @micropython.viper
+    def _is_programmable(current, new) -> bool:
+        """
+        Check whether new data can be programmed without erasing first.
+
+        A page program can only change bits from 1 to 0, so the new data has
+        to be a bitwise subset of the current content.
+
+        :param      current:  The current flash content
+        :type       current:  memoryview
+        :param      new:      The new data of the same length
+        :type       new:      list
+
+        :returns:   True if no erase is required, False otherwise
+        :rtype:     bool
+        """
+        c = ptr8(current)  # noqa: F821
+        n = ptr8(new)  # noqa: F821
+        for i in range(int(len(current))):
+            if n[i] & (c[i] ^ 0xFF):
+                return False
+        return True
+
+    def _flush_sector(self, sector_nr: int) -> None:
+        """
+        Write a cached sector back to the flash if it has been modified.
+
+        The sector is only erased if a change requires a bit to be set from 0
+        to 1, otherwise only the modified blocks are programmed.
+
+        :param      sector_nr:  The sector number
+        :type       sector_nr:  int
+        """
+        entry = self._sector_cache[sector_nr]
+        cache, dirty, erase = entry
+        if not dirty:
+            return
+
+        sector_addr = sector_nr * _SECTOR_SIZE
+        if erase:
+            self._sector_erase(addr=sector_addr)
+            # addr is multiple of _SECTOR_SIZE, so last byte is zero
+            self._write(buf=cache, addr=sector_addr)
+        else:
+            cache_mv = memoryview(cache)
+            for i in range(8):
+                if dirty & (1 << i):
+                    index = i * _BLOCK_SIZE
+                    # index is multiple of _BLOCK_SIZE, so last byte is 0
+                    self._write(
+                        buf=cache_mv[index:index + _BLOCK_SIZE],
+                        addr=sector_addr + index)
+
+        entry[1] = 0
+        entry[2] = False
+
+    def _load_sector(self, sector_nr: int) -> list:
+        """
+        Get the cache entry of a sector, read the sector if not yet cached.
 
+        The least recently used sector is written back and removed from the
+        cache if no sector buffer is free.
+
+        :param      sector_nr:  The sector number
+        :type       sector_nr:  int
+
+        :returns:   The sector buffer, dirty block bitmask and erase flag
+        :rtype:     list
+        """
+        lru = self._lru
+        entry = self._sector_cache.get(sector_nr)
+        if entry is not None:
+            if lru[-1] != sector_nr:
+                lru.remove(sector_nr)
+                lru.append(sector_nr)
+            return entry
+
+        if not self._free:
+            oldest = lru.pop(0)
+            self._flush_sector(sector_nr=oldest)
+            self._free.append(self._sector_cache.pop(oldest)[0])
+
+        cache = self._free.pop()
+        self._read(buf=cache, addr=sector_nr * _SECTOR_SIZE)
+        entry = [cache, 0, False]
+        self._sector_cache[sector_nr] = entry
+        lru.append(sector_nr)
+
+        return entry
+
+    def _drop_sectors(self, first: int, last: int) -> None:
+        """
+        Remove sectors from the cache without writing them back.
+
+        :param      first:  The first sector number
+        :type       first:  int
+        :param      last:   The sector number after the last one
+        :type       last:   int
+        """
+        for sector_nr in list(self._lru):
+            if first <= sector_nr < last:
+                self._lru.remove(sector_nr)
+                self._free.append(self._sector_cache.pop(sector_nr)[0])
+
+    def sync(self) -> None:
+        """
+        Write all cached changes to the flash.
+
+        Called by the VFS via ioctl(3) on file close and os.sync(), but not
+        on unmount. Call it before unmounting or powering off the device.
+        """
+        for sector_nr in self._lru:
+            self._flush_sector(sector_nr=sector_nr)
+
+    def ioctl(self, op: int, arg: int) -> int:
+        """
+        Control the block device, called by the VFS.
+
+        :param      op:   The operation
+        :type       op:   int
+        :param      arg:  The argument of the operation
+        :type       arg:  int
+
+        :returns:   Result of the operation, None if not supported
+        :rtype:     int
+        """
+        if op == 1:
+            # initialise the device
+            return 0
+        if op in (2, 3):
+            # shutdown or sync the device
+            self.sync()
+            return 0
+        if op == 4:
+            # number of blocks
+            return self.count()
+        if op == 5:
+            # number of bytes in a block
+            return _BLOCK_SIZE
+        if op == 6:
+            # erase a block, nothing to do as a block is erased on writing
+            # it, erasing the whole sector would destroy other blocks
+            return 0
+
+    @micropython.native
     def _writeblock(self, blocknum: int, buf: list) -> None:
         """
         Write a data block.
 
         To write a block, the sector (e.g. 4kB = 8 blocks) has to be erased
         first. Therefore, a sector will be read and saved in cache first,
-        then the given block will be replaced and the whole sector written
-        back when
+        then the given block will be replaced in the cache. The whole sector
+        is written back when it is evicted from the cache or the cache is
+        synced.
+
+        The erase is skipped if the block already contains the given data or
+        if the new data only clears bits of the current content.
 
         :param      blocknum:  The block number
         :type       blocknum:  int
         :param      buf:       The data buffer
         :type       buf:       list
         """
-        assert len(buf) == self.BLOCK_SIZE, \
+        assert len(buf) == _BLOCK_SIZE, \
             "invalid block length: {}".format(len(buf))
 
         sector_nr = blocknum // 8
-        sector_addr = sector_nr * self.SECTOR_SIZE
-        # index of first byte of page in sector (multiple of self.PAGE_SIZE)
+        # index of first byte of page in sector (multiple of _PAGE_SIZE)
         index = (blocknum << 9) & 0xfff
 
-        self._read(buf=self._cache, addr=sector_addr)
-        self._cache[index:index + self.BLOCK_SIZE] = buf  # apply changes
-        self._sector_erase(addr=sector_addr)
-        # addr is multiple of self.SECTOR_SIZE, so last byte is zero
-        self._write(buf=self._cache, addr=sector_addr)
+        entry = self._load_sector(sector_nr=sector_nr)
+        block = memoryview(entry[0])[index:index + _BLOCK_SIZE]
+        if block == buf:
+            # block content is already on the flash, nothing to do
+            return
 
+        # viper functions take positional arguments only
+        if not self._is_programmable(block, buf):
+            # a bit has to change from 0 to 1, which requires an erase
+            entry[2] = True
+
+        block[:] = buf  # apply changes
+        entry[1] |= 1 << (blocknum & 0x7)
+
+    @micropython.native
     def readblocks(self, blocknum: int, buf: list) -> None:
         """
-        Read a data block. The length has to be a multiple of self.BLOCK_SIZE
+        Read data blocks. The length has to be a multiple of self.BLOCK_SIZE
+
+        All blocks are read with a single command, modified blocks of the
+        sector cache are taken from the cache afterwards.
 
         :param      blocknum:  The starting block number
         :type       blocknum:  int
         :param      buf:       The data buffer
         :type       buf:       list
         """
-        assert len(buf) % self.BLOCK_SIZE == 0, \
+        assert len(buf) % _BLOCK_SIZE == 0, \
             'invalid buffer length: {}'.format(len(buf))
 
-        buf_len = len(buf)
-        if buf_len == self.BLOCK_SIZE:
-            self._read(buf=buf, addr=blocknum << 9)
-        else:
-            offset = 0
-            buf_mv = memoryview(buf)
-            while offset < buf_len:
-                self._read(buf=buf_mv[offset:offset + self.BLOCK_SIZE],
-                           addr=blocknum << 9)
-                offset += self.BLOCK_SIZE
-                blocknum += 1
-
+        # the flash auto-increments the address, read all blocks at once
+        self._read(buf=buf, addr=blocknum << 9)
+
+        last = blocknum + len(buf) // _BLOCK_SIZE
+        buf_mv = memoryview(buf)
+        for sector_nr, (cache, dirty, _) in self._sector_cache.items():
+            if not dirty:
+                continue
+            # replace blocks of cached sectors, their changes are not yet
+            # written to the flash
+            first = sector_nr * 8
+            start = max(blocknum, first)
+            end = min(last, first + 8)
+            if start < end:
+                buf_mv[(start - blocknum) << 9:(end - blocknum) << 9] = \
+                    memoryview(cache)[(start - first) << 9:(end - first) << 9]
+
+    @micropython.native
     def writeblocks(self, blocknum: int, buf: list) -> None:
         """
-        Write a data block.The length has to be a multiple of self.BLOCK_SIZE
+        Write data blocks. The length should be a multiple of self.BLOCK_SIZE
+
+        A last incomplete block is filled up with 0xFF.
 
         :param      blocknum:  The block number
         :type       blocknum:  int
@@ -384,22 +776,23 @@ class W25QFlash(object):
         :type       buf:       list
         """
         buf_len = len(buf)
-        if buf_len % self.BLOCK_SIZE != 0:
-            # appends xFF dummy bytes
-            buf += bytearray((self.BLOCK_SIZE - buf_len) * [255])
-
-        if buf_len == self.BLOCK_SIZE:
-            self._writeblock(blocknum=blocknum, buf=buf)
-        else:
-            offset = 0
-            buf_mv = memoryview(buf)
-            while offset < buf_len:
-                self._writeblock(blocknum=blocknum,
-                                 buf=buf_mv[offset:offset + self.BLOCK_SIZE])
-                offset += self.BLOCK_SIZE
-                blocknum += 1
-        # remove appended bytes
-        buf = buf[:buf_len]
+        # length of all complete blocks
+        full_len = buf_len - buf_len % _BLOCK_SIZE
+
+        offset = 0
+        buf_mv = memoryview(buf)
+        while offset < full_len:
+            self._writeblock(blocknum=blocknum,
+                             buf=buf_mv[offset:offset + _BLOCK_SIZE])
+            offset += _BLOCK_SIZE
+            blocknum += 1
+
+        if full_len < buf_len:
+            # fill the remaining block with xFF dummy bytes, the given buffer
+            # is not modified
+            tail = bytearray(_BLANK_BLOCK)
+            tail[:buf_len - full_len] = buf_mv[full_len:]
+            self._writeblock(blocknum=blocknum, buf=tail)
 
     def count(self) -> int:
         """
@@ -408,4 +801,4 @@ class W25QFlash(object):
         :returns:   Number of blocks
         :rtype:     int
         """
-        return int(self._capacity / self.BLOCK_SIZE)
+        return int(self._capacity / _BLOCK_SIZE)